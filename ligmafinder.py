@@ -1,13 +1,51 @@
 #!/usr/bin/env python3
 
 from collections import defaultdict
+from pathlib import Path
 import unicodedata
-import string
 import itertools
 import sys
+import os
 import argparse
 import random
-
+import pickle
+import tempfile
+import functools
+
+# Tables depend on the Unicode database and on the scan itself, so key the
+# cache on both. Bump _CACHE_VERSION whenever _populate_tables changes.
+_CACHE_VERSION = 2
+_CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "ligmafinder"
+_CACHE_PATH = _CACHE_DIR / f"tables-v{_CACHE_VERSION}-{unicodedata.unidata_version}.pkl"
+
+# Unicode blocks containing characters whose NFKC form is ASCII letters,
+# as half-open (start, end) ranges. Derived from a full scan of the Unicode
+# database below, where everything else normalizes to non-ASCII. Other
+# versions may add characters elsewhere, so they get a full scan instead.
+_CANDIDATE_RANGES_UNIDATA = "14.0.0"
+_CANDIDATE_RANGES = [
+    (0x00A0, 0x0250),    # Latin-1 Supplement, Latin Extended-A/B
+    (0x02B0, 0x0300),    # Spacing Modifier Letters
+    (0x1D00, 0x1DC0),    # Phonetic Extensions (+ Supplement)
+    (0x2070, 0x2190),    # Super/Subscripts, Letterlike Symbols, Number Forms
+    (0x2460, 0x2500),    # Enclosed Alphanumerics
+    (0x2C60, 0x2C80),    # Latin Extended-C
+    (0x3200, 0x3400),    # Enclosed CJK Letters and Months, CJK Compatibility
+    (0xA720, 0xA800),    # Latin Extended-D
+    (0xFB00, 0xFB50),    # Alphabetic Presentation Forms
+    (0xFF00, 0xFFF0),    # Halfwidth and Fullwidth Forms
+    (0x10780, 0x107C0),  # Latin Extended-F
+    (0x1D400, 0x1D800),  # Mathematical Alphanumeric Symbols
+    (0x1F100, 0x1F200),  # Enclosed Alphanumeric Supplement
+]
+
+def _is_char(value):
+    return isinstance(value, str) and len(value) == 1
+
+def _is_word(value):
+    return isinstance(value, str) and len(value) > 0
+
+@functools.lru_cache(maxsize=None)
 def get_real_name(char):
     return unicodedata.name(char)
 
@@ -17,44 +55,124 @@ class LigmaFinder:
         Initializes the tables
         """
         self.fancy_table = {}
-        self.lookup_table = defaultdict(list)
-        self._populate_tables()
+        self.lookup_table = {}
+
+        if not self._load_cache():
+            self._populate_tables()
+            self._save_cache()
+
+        self._index_tables()
+
+
+    def _load_cache(self):
+        try:
+            with open(_CACHE_PATH, "rb") as f:
+                fancy_table, lookup_table = pickle.load(f)
+            fancy_table = dict(fancy_table.items())
+            lookup_table = {k: tuple(v) for k, v in lookup_table.items()}
+        except Exception:
+            # Missing, corrupt or unreadable cache, just rebuild it.
+            # Unpickling garbage can raise nearly anything.
+            return False
+
+        # Same shape as _populate_tables builds, _index_tables relies on it
+        if not (all(_is_char(c) and _is_word(n) for c, n in fancy_table.items())
+                and all(_is_word(k) and all(map(_is_char, v)) for k, v in lookup_table.items())):
+            return False
+
+        self.fancy_table = fancy_table
+        self.lookup_table = lookup_table
+        return True
+
+
+    def _save_cache(self):
+        tmp_path = None
+        try:
+            _CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+            # Write to a temp file and rename it into place, so an interrupted
+            # or concurrent run never leaves a partial cache behind
+            with tempfile.NamedTemporaryFile("wb", dir=_CACHE_DIR, delete=False) as f:
+                tmp_path = f.name
+                pickle.dump((self.fancy_table, self.lookup_table), f)
+            os.replace(tmp_path, _CACHE_PATH)
+        except OSError:
+            # Caching is best effort
+            if tmp_path is not None:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
 
 
-    # TODO: Cache locally instead of computing each time
     def _populate_tables(self):
-        for i in range(0, sys.maxunicode + 1):
-
+        if unicodedata.unidata_version == _CANDIDATE_RANGES_UNIDATA:
+            codepoints = itertools.chain.from_iterable(
+                range(start, end) for start, end in _CANDIDATE_RANGES
+            )
+        else:
             # Skip standard ASCII
-            if i < 128:
-                continue
+            codepoints = range(128, sys.maxunicode + 1)
 
+        lookup_table = defaultdict(list)
+        for i in codepoints:
             char = chr(i)
 
             # NOTE: Must be a valid identifier part per PEP 3131
             # if not char.isidentifier():
             #     continue
 
+            # NFKC-stable non-ASCII chars normalize to themselves, never to ASCII
+            if unicodedata.is_normalized('NFKC', char):
+                continue
+
             norm = unicodedata.normalize('NFKC', char)
 
             # Add if useful ascii expansion
-            if norm and all(chars in string.ascii_letters for chars in norm):
+            if norm.isascii() and norm.isalpha():
 
                 self.fancy_table[char] = norm
-                self.lookup_table[norm].append(char)
+                lookup_table[norm].append(char)
+
+        # Freeze the variants, they never change after the scan
+        self.lookup_table = {k: tuple(v) for k, v in lookup_table.items()}
+
+
+    def _index_tables(self):
+        # Every variant is a single codepoint, so store each target's variants
+        # as one flat string for product() to walk instead of a list of strs
+        self.variants_flat = {k: "".join(v) for k, v in self.lookup_table.items()}
+
+        # Membership checks for the matching loops
+        self._lookup_keys = frozenset(self.lookup_table)
+
+        # Display orders for the table printers
+        self._sorted_fancy_keys = sorted(self.fancy_table, key=ord)
+        self._sorted_lookup_keys = sorted(self.lookup_table, key=lambda x: (-len(x), x))
+
+        # Longest multi-char expansion, bounds every substring search
+        self._max_key_len = max((len(k) for k in self.lookup_table), default=1)
+
+        # Longest key starting with each char, so greedy matching can skip
+        # lengths that cannot exist
+        self._max_key_len_from = {}
+        for key in self.lookup_table:
+            if len(key) > self._max_key_len_from.get(key[0], 0):
+                self._max_key_len_from[key[0]] = len(key)
 
 
     def print_full_table(self):
 
-        print(f"─── PEP 3131 Identifiers Normalizing to ASCII ───")
-        print("─" * 85)
-        print(f"{'Code':<9} │ {'Char':<4} │ {'NFKC':<4} │ {'Name'}")
-        print("─" * 85)
+        # Collect all rows and write them at once, print() per row is slow
+        lines = [
+            f"─── PEP 3131 Identifiers Normalizing to ASCII ───",
+            "─" * 85,
+            f"{'Code':<9} │ {'Char':<4} │ {'NFKC':<4} │ {'Name'}",
+            "─" * 85,
+        ]
 
         # Iterate over the stored table to avoid re-scanning logic
-        sorted_chars = sorted(self.fancy_table.keys(), key=ord)
-
-        for char in sorted_chars:
+        for char in self._sorted_fancy_keys:
             code_point = ord(char)
             norm = self.fancy_table[char]
             try:
@@ -62,33 +180,44 @@ class LigmaFinder:
             except ValueError:
                 name = "-"
 
-            print(f"U+{code_point:04X}{'':<3} │ {char:<4} │ {norm:<4} │ {name}")
+            lines.append(f"U+{code_point:04X}{'':<3} │ {char:<4} │ {norm:<4} │ {name}")
+
+        sys.stdout.write("\n".join(lines) + "\n")
 
 
     def print_lookuptable(self):
 
-        print("\n─── Lookup Table (ASCII -> Fancy Variants) ───")
-        print(f"{'Target':<10} │ {'Count':<5} │ {'Variants'}")
-        print("─" * 80)
+        lines = [
+            "\n─── Lookup Table (ASCII -> Fancy Variants) ───",
+            f"{'Target':<10} │ {'Count':<5} │ {'Variants'}",
+            "─" * 80,
+        ]
         
-        # sort alphabetically
-        sorted_keys = sorted(self.lookup_table.keys(), key=lambda x: (-len(x), x))
-        
-        for key in sorted_keys:
+        # longest first, then alphabetically
+        for key in self._sorted_lookup_keys:
             variants = self.lookup_table[key]
             # Limit to first 15
             variants_str = ", ".join(variants[:15])
             if len(variants) > 15:
                 variants_str += f", ... ({len(variants)-15} more)"
                 
-            print(f"{key:<10} │ {len(variants):<5} │ {variants_str}")
+            lines.append(f"{key:<10} │ {len(variants):<5} │ {variants_str}")
+
+        sys.stdout.write("\n".join(lines) + "\n")
 
 
     def print_useful_slices(self, word):
         print(f"─── Useful slices for: '{word}' ───\n")
-        hit = False
-        for key in self.lookup_table.keys():
-            if len(key) > 1 and key in word:
+        # Only substrings up to the longest key can match, so check those
+        # directly instead of scanning every key against the word
+        seen = set()
+        for i in range(len(word)):
+            for j in range(i + 2, min(len(word), i + self._max_key_len) + 1):
+                key = word[i:j]
+                if key in seen or key not in self._lookup_keys:
+                    continue
+                seen.add(key)
+
                 char = self.lookup_table[key][0]
                 try:
                     name = get_real_name(char)
@@ -96,74 +225,80 @@ class LigmaFinder:
                     name = "-"
                 # print(f"[*] key:{key} in word {word}")
                 print(f"U+{ord(char):04X}{'':<3} │ {char:<4} │ {key:<4} │ {name}")
-                hit = True
 
-        if not hit:
+        if not seen:
             print(f"No slices found")
 
-    def _greedy_compile(self, word, max_candidates=1):
-
-        compiled_words = []
+    def _greedy_options(self, word):
 
-        # greedy algorithm to find shortest
-        i = 0
+        # DP for the fewest chunks: segments[i] is the minimum number of chunks
+        # covering word[i:], step[i] the end of the first chunk. Fed from the
+        # right, so every segments[j] is known when i is reached.
         n = len(word)
-        while i < n:
-            found = False 
+        segments = [0] * (n + 1)
+        step = [0] * (n + 1)
+        for i in range(n - 1, -1, -1):
+            best, best_j = float("inf"), i + 1
 
-            # Look for longest match first
-            for j in range(n, i, -1):
-                chunk = word[i:j]
-                
-                if chunk in self.lookup_table:
-                    compiled_words.append(self.lookup_table[chunk])
-                    found = True
-                    i = j
-                    break
-
-            if not found:
-                compiled_words.append([word[i]])
-                i += 1
+            # Try longest first so ties keep the longest chunk. A single char
+            # is always possible, as itself if it has no variants.
+            longest = self._max_key_len_from.get(word[i], 1)
+            for j in range(min(n, i + longest), i, -1):
+                if segments[j] + 1 < best and (j == i + 1 or word[i:j] in self._lookup_keys):
+                    best, best_j = segments[j] + 1, j
 
-        # permutations
-        iterator = ("".join(combo) for combo in itertools.product(*compiled_words))
+            segments[i], step[i] = best, best_j
 
-        if max_candidates is None:
-            return list(iterator)
-
-        return list(itertools.islice(iterator, max_candidates))
+        compiled_words = []
+        i = 0
+        while i < n:
+            j = step[i]
+            chunk = word[i:j]
+            compiled_words.append(self.variants_flat.get(chunk, chunk))
+            i = j
 
-    def _compile(self, word, max_candidates=1):
-        letter_options = []
+        return compiled_words
 
-        for c in word:
-            candidates = self.lookup_table[c]
-            
-            if candidates:
-                letter_options.append(candidates)
-            else:
-                letter_options.append([c])
+    def _options(self, word):
+        # Chars without variants stay as themselves
+        return [self.variants_flat.get(c, c) for c in word]
 
-        iterator = ("".join(combo) for combo in itertools.product(*letter_options))
+    def _greedy_compile(self, word):
+        # permutations, streamed lazily since there can be millions
+        return ("".join(combo) for combo in itertools.product(*self._greedy_options(word)))
 
-        if max_candidates is None:
-            return list(iterator)
-        
-        return list(itertools.islice(iterator, max_candidates))
+    def _compile(self, word):
+        return ("".join(combo) for combo in itertools.product(*self._options(word)))
 
     def compile(self, word, greedy=True, max_candidates=1):
-        # Generate 3x more for randomness
-        fetch_count = max_candidates * 3 if max_candidates else None
-
-        if greedy:
-            results = self._greedy_compile(word, max_candidates=fetch_count)
-        else:
-            results = self._compile(word, max_candidates=fetch_count)
+        # NOTE: Returns a lazy iterator when max_candidates is falsy (all
+        # candidates), otherwise a list. Don't len() the former.
+        if not max_candidates:
+            if greedy:
+                return self._greedy_compile(word)
+            return self._compile(word)
+
+        options = self._greedy_options(word) if greedy else self._options(word)
+
+        # Default CLI case, just pick a random variant per chunk
+        if max_candidates == 1:
+            return ["".join(map(random.choice, options))]
+
+        # Reservoir sample (Algorithm R) from the first 3x combinations for
+        # randomness, without materializing them. Only the kept ones are joined.
+        sample = []
+        combos = itertools.islice(itertools.product(*options), max_candidates * 3)
+        for i, combo in enumerate(combos):
+            if i < max_candidates:
+                sample.append(combo)
+            else:
+                r = random.randrange(i + 1)
+                if r < max_candidates:
+                    sample[r] = combo
 
-        if results and max_candidates and len(results) > max_candidates:
-            random.shuffle(results)
-            return results[:max_candidates]
-        return results
+        # Algorithm R leaves survivors in product order, shuffle them
+        random.shuffle(sample)
+        return ["".join(combo) for combo in sample]
 
 
 def main():
@@ -223,13 +358,16 @@ def main():
 
         res = ligma.compile(word, greedy=greedy_mode, max_candidates=max_candidates)
 
-        if res:
-            for r in res:
-                print(f'    |{r}|\t({len(r)} chars)')
-        else:
+        # Print as they are generated instead of collecting them first
+        count = 0
+        for r in res:
+            print(f'    |{r}|\t({len(r)} chars)')
+            count += 1
+
+        if not count:
             print("No results found (Try removing --no-greedy if the word contains punctuation)")
 
-        stats.append(f"Generated {len(res) if res else 0} candidates for '{word}'")
+        stats.append(f"Generated {count} candidates for '{word}'")
 
     print(f"\n{'─' * 40}\n" + "\n".join(stats))
 